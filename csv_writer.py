@@ -1,12 +1,65 @@
-import json
+import csv
+import gc
 import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from twarc.decorators2 import FileSizeProgressBar
 from more_itertools import ichunked
 
 import dataframe_converter
 
+try:
+    # pyarrow is optional, only needed for parquet output.
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
 log = logging.getLogger("twarc")
 
+# Converter counts that describe the configuration rather than progress,
+# and so must not be summed when merging worker counts.
+_NON_COUNTER_KEYS = frozenset(("input_columns", "output_columns"))
+
+
+def _parquet_value(value):
+    """
+    Render a cell for the all-string parquet schema. Parquet stores strings
+    verbatim, so unlike the csv path there is no newline escaping: only
+    lists and dicts are JSON encoded.
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (list, dict)):
+        return dataframe_converter.json_dumps(value)
+    if isinstance(value, float) and value != value:
+        return None
+    return str(value)
+
+
+def _process_batch(converter, lines, encode=True):
+    """
+    Parse and convert one batch of raw lines in a worker process, returning
+    the rows along with the counts and unexpected fields accumulated so the
+    parent can merge and report them. Parquet output takes the rows
+    unencoded (encode=False), csv takes them with the per-cell escaping
+    applied.
+    """
+    objects = []
+    for line in lines:
+        converter.counts["lines"] += 1
+        if line.strip() != "":
+            try:
+                objects.append(dataframe_converter.json_loads(line))
+            except Exception as ex:
+                converter.counts["parse_errors"] += 1
+                log.error(f"Error when trying to parse json: '{line}' {ex}")
+    if encode:
+        rows = converter.process_rows(objects)
+    else:
+        rows = list(converter._iter_flat(objects))
+    return rows, converter.counts, converter._reported_columns
+
 
 class CSVConverter:
     """
@@ -20,6 +73,7 @@ class CSVConverter:
         converter=dataframe_converter.DataFrameConverter(),
         output_format="csv",
         batch_size=100,
+        workers=1,
         hide_progress=False,
     ):
         self.infile = infile
@@ -27,58 +81,199 @@ class CSVConverter:
         self.converter = converter
         self.output_format = output_format
         self.batch_size = batch_size
+        self.workers = workers
         self.hide_progress = hide_progress
+        # Created lazily on the first write so empty input never produces
+        # an output file.
+        self._csv_writer = None
+        self._parquet_writer = None
         self.progress = FileSizeProgressBar(infile, outfile, disable=(hide_progress or not self.infile.seekable()))
 
+    # How much of the input file to read per read() call. Bulk reads split
+    # on newlines are much faster than a readline call per line.
+    CHUNK_SIZE = 4 * 1024 * 1024
+
+    def _read_raw_lines(self):
+        """
+        Generator for reading raw lines from a file in large chunks,
+        splitting on newlines and keeping the trailing partial line for the
+        next chunk. Progress bar is based on file size and updates once per
+        chunk rather than once per line.
+        """
+        update_progress = not self.hide_progress and self.infile.seekable()
+        buffer = ""
+        while True:
+            chunk = self.infile.read(self.CHUNK_SIZE)
+            if not chunk:
+                break
+            buffer += chunk
+            lines = buffer.split("\n")
+            buffer = lines.pop()
+            yield from lines
+            if update_progress:
+                self.progress.update(self.infile.tell() - self.progress.n)
+        if buffer:
+            yield buffer
+
     def _read_lines(self):
         """
-        Generator for reading files line by line from a file. Progress bar is based on file size.
+        Generator for reading json objects from the input file.
         """
-        line = self.infile.readline()
-        while line:
+        for line in self._read_raw_lines():
             self.converter.counts["lines"] += 1
             if line.strip() != "":
                 try:
-                    o = json.loads(line)
-                    yield o
+                    yield dataframe_converter.json_loads(line)
                 except Exception as ex:
                     self.converter.counts["parse_errors"] += 1
                     log.error(f"Error when trying to parse json: '{line}' {ex}")
-            if not self.hide_progress and self.infile.seekable():
-                self.progress.update(self.infile.tell() - self.progress.n)
-            line = self.infile.readline()
 
-    def _write_output(self, _df, first_batch):
+    def _write_parquet(self, rows):
         """
-        Write out the dataframe chunk by chunk
+        Write out a batch of unencoded rows as a parquet row group. Arrow's
+        columnar string encoder replaces the csv quoting path entirely, and
+        text cells keep their newlines since parquet doesn't need the csv
+        escape.
+        """
+        if self._parquet_writer is None:
+            self._parquet_schema = pyarrow.schema(
+                (column, pyarrow.string())
+                for column in self.converter.output_columns
+            )
+            self._parquet_writer = pyarrow.parquet.ParquetWriter(
+                self.outfile.name, self._parquet_schema
+            )
+
+        rows = list(rows)
+        output_columns = self.converter.output_columns
+        arrays = [
+            pyarrow.array(
+                [_parquet_value(row.get(column)) for row in rows],
+                type=pyarrow.string(),
+            )
+            for column in output_columns
+        ]
+        self._parquet_writer.write_table(
+            pyarrow.Table.from_arrays(arrays, schema=self._parquet_schema)
+        )
+        self.converter.counts["rows"] += len(rows)
+
+    def _write_output(self, rows):
+        """
+        Write out the batch of rows, chunk by chunk
 
         todo: take parameters from commandline for optional output formats.
         """
-        if first_batch:
-            mode = "w"
-            header = True
-        else:
-            mode = "a+"
-            header = False
-
-        self.converter.counts["rows"] += len(_df)
-        _df.to_csv(
-            self.outfile,
-            mode=mode,
-            columns=self.converter.output_columns,
-            index=False,
-            header=header,
-        )  # todo: (Optional) arguments for to_csv
+        if self.output_format == "parquet":
+            self._write_parquet(rows)
+            return
+        if self._csv_writer is None:
+            self._csv_writer = csv.DictWriter(
+                self.outfile,
+                fieldnames=self.converter.output_columns,
+                extrasaction="ignore",
+                restval="",
+                lineterminator="\n",
+            )
+            self._csv_writer.writeheader()
+
+        # rows may be a lazy generator, so count while writing
+        written = 0
+        for row in rows:
+            self._csv_writer.writerow(row)
+            written += 1
+        self.converter.counts["rows"] += written
+
+    def _merge_batch(self, rows, counts, unexpected):
+        """
+        Merge a worker batch back into the main converter: combine counts,
+        report unexpected fields once per field, and count and filter
+        duplicates, which workers neither count nor filter because they
+        cannot see across batches.
+        """
+        converter = self.converter
+        converter._report_unexpected(unexpected)
+        for key, value in counts.items():
+            if key not in _NON_COUNTER_KEYS and key != "duplicates":
+                converter.counts[key] += value
+        unique_rows = []
+        for row in rows:
+            row_id = row.get("id")
+            if row_id is not None:
+                if row_id in converter.dataset_ids:
+                    converter.counts["duplicates"] += 1
+                    if not converter.allow_duplicates:
+                        continue
+                else:
+                    converter.dataset_ids.add(row_id)
+            unique_rows.append(row)
+        self._write_output(unique_rows)
+
+    def _process_parallel(self):
+        """
+        Convert batches in worker processes, writing results in submission
+        order. A bounded queue of pending futures keeps memory flat.
+        """
+        # Workers get a pristine converter so the parent's growing
+        # dataset_ids set isn't pickled with every batch. They always allow
+        # duplicates: the parent is the sole owner of duplicate accounting
+        # in _merge_batch, otherwise intra-batch duplicates that workers
+        # yield under --allow-duplicates would be counted twice.
+        worker_converter = dataframe_converter.DataFrameConverter(
+            input_data_type=self.converter.input_data_type,
+            json_encode_all=self.converter.json_encode_all,
+            json_encode_text=self.converter.json_encode_text,
+            json_encode_lists=self.converter.json_encode_lists,
+            inline_referenced_tweets=self.converter.inline_referenced_tweets,
+            merge_retweets=self.converter.merge_retweets,
+            allow_duplicates=True,
+        )
+        # Workers collect unexpected fields silently; the parent reports
+        # them once per field in _merge_batch.
+        worker_converter.report_errors = False
+        worker_converter.columns = self.converter.columns
+        worker_converter.output_columns = self.converter.output_columns
+        worker_converter._column_trie = self.converter._column_trie
+
+        encode = self.output_format != "parquet"
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = deque()
+            for batch in ichunked(self._read_raw_lines(), self.batch_size):
+                pending.append(
+                    pool.submit(_process_batch, worker_converter, list(batch), encode)
+                )
+                if len(pending) >= self.workers * 2:
+                    self._merge_batch(*pending.popleft().result())
+            while pending:
+                self._merge_batch(*pending.popleft().result())
 
     def process(self):
         """
         Process a file containing JSON into a CSV
         """
 
-        # Flag for writing header & appending to CSV file
-        first_batch = True
-        for batch in ichunked(self._read_lines(), self.batch_size):
-            self._write_output(self.converter.process(batch), first_batch)
-            first_batch = False
+        # Converting allocates thousands of short-lived dicts per batch and
+        # none of them form reference cycles, so pause the cyclic garbage
+        # collector while converting instead of letting it rescan them.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if self.workers > 1:
+                self._process_parallel()
+            else:
+                # parquet takes the rows unencoded, csv with escaping applied
+                iter_batch = (
+                    self.converter._iter_flat
+                    if self.output_format == "parquet"
+                    else self.converter.iter_rows
+                )
+                for batch in ichunked(self._read_lines(), self.batch_size):
+                    self._write_output(iter_batch(batch))
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+                gc.collect()
 
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
         self.progress.close()
@@ -1,15 +1,84 @@
 import json
-import copy
 import click
-import itertools
-from collections import ChainMap
 import logging
+from sys import intern
 
 import pandas as pd
 from twarc import ensure_flattened
 
 log = logging.getLogger("twarc")
 
+try:
+    # orjson parses and serializes considerably faster than stdlib json,
+    # but it is optional: fall back to stdlib if it is not installed.
+    import orjson
+
+    def json_loads(data):
+        return orjson.loads(data)
+
+    def json_dumps(obj):
+        return orjson.dumps(obj).decode()
+
+except ImportError:
+    json_loads = json.loads
+    json_dumps = json.dumps
+
+# Marks column trie nodes that are themselves columns. None can never clash
+# with a JSON object key, and survives pickling to worker processes.
+_LEAF = None
+
+
+def _collect_leaf_paths(obj, prefix, add_unexpected):
+    """
+    Report the dotted path of every leaf under an unknown branch, so the
+    --extra-input-columns suggestion in the error message names the actual
+    columns and fixes the problem in one pass. Empty dicts produce no
+    columns, same as json_normalize.
+    """
+    for key, value in obj.items():
+        path = prefix + "." + key
+        if isinstance(value, dict):
+            _collect_leaf_paths(value, path, add_unexpected)
+        else:
+            add_unexpected(path)
+
+
+def _flatten_tweet(tweet, trie, row, unexpected):
+    """
+    Flatten a tweet into a single dict with dotted column names, walking the
+    column trie alongside the data so branches that cannot contribute to the
+    columns are pruned without building any key strings for them. Lists are
+    kept as-is so they can be JSON encoded later. Much faster than
+    `pd.json_normalize` as the column set is known in advance.
+
+    This is the hottest loop in the converter, so it is a module level
+    function with an explicit stack: no attribute lookups and no Python
+    function call per nesting level. (The package ships as pure Python, so a
+    compiled extension is not an option here.)
+    """
+    stack = [(tweet, trie, "")]
+    pop = stack.pop
+    push = stack.append
+    add_unexpected = unexpected.add
+    while stack:
+        obj, node, prefix = pop()
+        node_get = node.get
+        for key, value in obj.items():
+            child = node_get(key)
+            if isinstance(value, dict):
+                if child is not None:
+                    push((value, child, prefix + key + "."))
+                elif value:
+                    # Unknown branch: the row is skipped anyway, so walk the
+                    # subtree just to report the full dotted leaf paths.
+                    _collect_leaf_paths(value, prefix + key, add_unexpected)
+            elif child is not None and _LEAF in child:
+                # Column names are drawn from a small fixed set, interning
+                # them makes every row dict share the same key objects.
+                row[intern(prefix + key)] = value
+            else:
+                add_unexpected(prefix + key)
+
 DEFAULT_TWEET_COLUMNS = """id
 conversation_id
 referenced_tweets.replied_to.id
@@ -188,35 +257,51 @@ class DataFrameConverter:
         self.merge_retweets = merge_retweets
         self.allow_duplicates = allow_duplicates
         self.input_data_type = input_data_type
+        default_columns = {
+            "tweets": DEFAULT_TWEET_COLUMNS,
+            "users": DEFAULT_USER_COLUMNS,
+            "compliance": DEFAULT_COMPLIANCE_COLUMNS,
+            "counts": DEFAULT_COUNTS_COLUMNS,
+            "lists": DEFAULT_LISTS_COLUMNS,
+        }
+        # Deduplicate with a set, preserving order: "x not in list" scans
+        # the growing list for every candidate column.
         self.columns = list()
-        if input_data_type == "tweets":
-            self.columns.extend(
-                x for x in DEFAULT_TWEET_COLUMNS if x not in self.columns
-            )
-        if input_data_type == "users":
-            self.columns.extend(
-                x for x in DEFAULT_USER_COLUMNS if x not in self.columns
-            )
-        if input_data_type == "compliance":
-            self.columns.extend(
-                x for x in DEFAULT_COMPLIANCE_COLUMNS if x not in self.columns
-            )
-        if input_data_type == "counts":
-            self.columns.extend(
-                x for x in DEFAULT_COUNTS_COLUMNS if x not in self.columns
-            )
-        if input_data_type == "lists":
-            self.columns.extend(
-                x for x in DEFAULT_LISTS_COLUMNS if x not in self.columns
-            )
+        seen = set()
+        input_columns = list(default_columns.get(input_data_type, []))
         if extra_input_columns:
-            self.columns.extend(
-                x for x in extra_input_columns.split(",") if x not in self.columns
-            )
+            input_columns.extend(extra_input_columns.split(","))
+        for column in input_columns:
+            if column not in seen:
+                seen.add(column)
+                self.columns.append(column)
         self.output_columns = (
             output_columns.split(",") if output_columns else self.columns
         )
+        # Prefix trie over the column names, so the flattener can prune
+        # whole subtrees that cannot contribute to any column. Nodes marked
+        # with _LEAF are actual columns.
+        self._column_trie = {}
+        for column in self.columns:
+            node = self._column_trie
+            for part in column.split("."):
+                node = node.setdefault(part, {})
+            node[_LEAF] = True
         self.dataset_ids = dataset_ids if dataset_ids else set()
+        # Unexpected fields seen so far, each reported only once. Worker
+        # processes set report_errors to False and just collect them here,
+        # the parent process does the reporting with its persistent state.
+        self.report_errors = True
+        self._reported_columns = set()
+        # Pick the row encoder for this configuration once, so the per-cell
+        # loop doesn't re-check the encoding options for every value. The
+        # default configuration only escapes newlines and encodes lists.
+        if self.json_encode_all:
+            self._encode_row = self._encode_row_all
+        elif self.json_encode_text or self.json_encode_lists:
+            self._encode_row = self._encode_row_partial
+        else:
+            self._encode_row = self._encode_row_newlines_only
         self.counts = (
             counts
             if counts
@@ -237,39 +322,14 @@ class DataFrameConverter:
             }
         )
 
-    def _flatten_objects(self, objects):
-        """
-        Generate flattened tweets from a batch of parsed lines.
-        """
-        for o in objects:
-            for item in ensure_flattened(o):
-                yield item
-
-    def _inline_referenced_tweets(self, tweet):
-        """
-        (Optional) Insert referenced tweets into the main CSV as new rows
-        """
-        if "referenced_tweets" in tweet and self.inline_referenced_tweets:
-            for referenced_tweet in tweet["referenced_tweets"]:
-                # extract the referenced tweet as a new row
-                self.counts["referenced_tweets"] += 1
-                # inherit __twarc metadata from parent tweet
-                referenced_tweet["__twarc"] = (
-                    tweet["__twarc"] if "__twarc" in tweet else None
-                )
-                # write tweet as new row if referenced tweet exists (has more than the 3 default fields):
-                if len(referenced_tweet.keys()) > 3:
-                    yield self._format_tweet(referenced_tweet)
-                else:
-                    self.counts["unavailable"] += 1
-        yield self._format_tweet(tweet)
-
     def _format_tweet(self, tweet):
         """
         Make the tweet objects easier to deal with, removing extra info and changing the structure.
         """
-        # Make a copy of the original flattened tweet
-        tweet = copy.deepcopy(tweet)
+        # Shallow copy so popped keys don't mutate the caller's dict. A deep
+        # copy is unnecessary: nested objects are only read, and the
+        # referenced tweets mutated below are discarded after this batch.
+        tweet = tweet.copy()
         # Deal with pinned tweets for user datasets, `tweet` here is actually a user:
         # remove the tweet from a user dataset, pinned_tweet_id remains:
         tweet.pop("pinned_tweet", None)
@@ -278,24 +338,30 @@ class DataFrameConverter:
 
         if "referenced_tweets" in tweet:
 
+            # A single pass over the references, tracking the last of each
+            # type and collecting the id references to leave behind:
+            reply_tweet = retweeted_tweet = quoted_tweet = None
+            references = {}
+            for referenced in tweet["referenced_tweets"]:
+                referenced_type = referenced["type"]
+                if referenced_type == "replied_to":
+                    reply_tweet = referenced
+                elif referenced_type == "retweeted":
+                    retweeted_tweet = referenced
+                elif referenced_type == "quoted":
+                    quoted_tweet = referenced
+                references[referenced_type] = {"id": referenced["id"]}
+
             # Count Replies:
-            replies = [
-                t for t in tweet["referenced_tweets"] if t["type"] == "replied_to"
-            ]
-            reply_tweet = replies[-1] if replies else None
             if "in_reply_to_user_id" in tweet or reply_tweet:
                 self.counts["replies"] += 1
 
             # Extract Retweet only
-            rts = [t for t in tweet["referenced_tweets"] if t["type"] == "retweeted"]
-            retweeted_tweet = rts[-1] if rts else None
             if retweeted_tweet and "author_id" in retweeted_tweet:
                 self.counts["retweets"] += 1
                 tweet["retweeted_user_id"] = retweeted_tweet["author_id"]
 
             # Extract Quoted tweet
-            qts = [t for t in tweet["referenced_tweets"] if t["type"] == "quoted"]
-            quoted_tweet = qts[-1] if qts else None
             if quoted_tweet and "author_id" in quoted_tweet:
                 self.counts["quotes"] += 1
                 tweet["quoted_user_id"] = quoted_tweet["author_id"]
@@ -318,13 +384,9 @@ class DataFrameConverter:
                     "public_metrics", tweet.pop("public_metrics", None)
                 )
 
-            # reconstruct referenced_tweets object
-            referenced_tweets = [
-                {r["type"]: {"id": r["id"]}} for r in tweet["referenced_tweets"]
-            ]
+            # reconstruct referenced_tweets object:
             # leave behind references, but not the full tweets
-            # ChainMap flattens list into properties
-            tweet["referenced_tweets"] = dict(ChainMap(*referenced_tweets))
+            tweet["referenced_tweets"] = references
         else:
             tweet["referenced_tweets"] = {}
 
@@ -342,87 +404,223 @@ class DataFrameConverter:
 
         return tweet
 
-    def _process_tweets(self, tweets):
-        """
-        Count, deduplicate objects before adding them to the dataframe.
-        """
-        for tweet in tweets:
-            if "id" in tweet:
-                tweet_id = tweet["id"]
-                self.counts["tweets"] += 1
-                if tweet_id in self.dataset_ids:
-                    self.counts["duplicates"] += 1
-                if self.allow_duplicates:
-                    yield tweet
-                else:
-                    if tweet_id not in self.dataset_ids:
-                        yield tweet
-                self.dataset_ids.add(tweet_id)
-            elif self.input_data_type == "counts":
-                self.counts["tweets"] += 1
-                yield tweet
-            else:
-                # non tweet objects are usually streaming API errors etc.
-                self.counts["non_objects"] += 1
-
     def _process_dataframe(self, _df):
         """
         Apply additional preprocessing to the DataFrame contents.
         """
 
-        # (Optional) json encode all
-        if self.json_encode_all:
-            _df = _df.applymap(json.dumps, na_action="ignore")
-        else:
-            # (Optional) text escape for any text fields
-            if self.json_encode_text:
-                _df = _df.applymap(
-                    lambda x: json.dumps(x) if type(x) is str else x,
-                    na_action="ignore",
-                )
-            else:
-                # Mandatory newline escape to prevent breaking csv format:
-                _df = _df.applymap(
-                    lambda x: x.replace("\r", "").replace("\n", r"\n")
-                    if type(x) is str
-                    else x,
-                    na_action="ignore",
-                )
-            # (Optional) json for lists
-            if self.json_encode_lists:
-                _df = _df.applymap(
-                    lambda x: json.dumps(x) if pd.api.types.is_list_like(x) else x,
-                    na_action="ignore",
-                )
+        # Iterate columns instead of applymap over every cell: only object
+        # dtype columns can hold the strings and lists that need escaping or
+        # encoding, so numeric columns pass through untouched.
+        json_encode_strings = self.json_encode_all or self.json_encode_text
+        json_encode_lists = self.json_encode_all or self.json_encode_lists
+        for column in _df.columns:
+            if not self.json_encode_all and _df[column].dtype != object:
+                continue
+            series = _df[column]
+            if not json_encode_strings:
+                # Mandatory newline escape to prevent breaking csv format.
+                # Series.str.replace runs in compiled code, far faster than
+                # a Python call per cell; non-string cells come back as NaN
+                # and are restored from the original series.
+                is_str = series.map(type).eq(str)
+                if is_str.any():
+                    escaped = series.str.replace("\r", "", regex=False).str.replace(
+                        "\n", r"\n", regex=False
+                    )
+                    series = escaped.where(is_str, series)
+                    _df[column] = series
+                if not json_encode_lists:
+                    continue
+            values = series.tolist()
+            changed = False
+            for i, value in enumerate(values):
+                if isinstance(value, str):
+                    if json_encode_strings:
+                        # (Optional) json encode / escape text fields
+                        values[i] = json_dumps(value)
+                        changed = True
+                elif isinstance(value, (list, dict)):
+                    # (Optional) json for lists
+                    if json_encode_lists:
+                        values[i] = json_dumps(value)
+                        changed = True
+                elif (
+                    self.json_encode_all
+                    and value is not None
+                    and value == value  # skip NaN, like na_action="ignore"
+                ):
+                    values[i] = json_dumps(value)
+                    changed = True
+            if changed:
+                _df[column] = values
         return _df
 
-    def process(self, objects):
+    def _encode_row_all(self, row):
         """
-        Process the objects into a pandas dataframe.
+        Row encoder for json_encode_all: everything except missing values
+        is JSON encoded.
         """
+        for key, value in row.items():
+            if value is not None and value == value:  # skip None and NaN
+                row[key] = json_dumps(value)
 
-        tweet_batch = itertools.chain.from_iterable(
-            self._process_tweets(self._inline_referenced_tweets(tweet))
-            for tweet in self._flatten_objects(objects)
-        )
-        _df = pd.json_normalize(list(tweet_batch))
-        # Check for mismatched columns
-        diff = set(_df.columns) - set(self.columns)
-        if len(diff) > 0:
+    def _encode_row_partial(self, row):
+        """
+        Row encoder for the default configuration: mandatory newline escape
+        (or optional JSON encode) for strings, optional JSON for lists.
+        """
+        encode_text = self.json_encode_text
+        encode_lists = self.json_encode_lists
+        for key, value in row.items():
+            if isinstance(value, str):
+                if encode_text:
+                    # (Optional) json encode / escape text fields
+                    row[key] = json_dumps(value)
+                else:
+                    # Mandatory newline escape to prevent breaking csv format:
+                    row[key] = value.replace("\r", "").replace("\n", r"\n")
+            elif encode_lists and isinstance(value, (list, dict)):
+                # (Optional) json for lists
+                row[key] = json_dumps(value)
+
+    def _encode_row_newlines_only(self, row):
+        """
+        Row encoder for when all JSON encoding options are off: only the
+        mandatory newline escape for strings remains.
+        """
+        for key, value in row.items():
+            if isinstance(value, str):
+                row[key] = value.replace("\r", "").replace("\n", r"\n")
+
+    def _report_unexpected(self, unexpected):
+        """
+        Report unexpected fields, once per newly seen field so repeated rows
+        don't flood the output.
+        """
+        new_columns = unexpected - self._reported_columns
+        if len(new_columns) > 0:
+            self._reported_columns |= new_columns
+            if not self.report_errors:
+                return
             click.echo(
                 click.style(
-                    f"💔 ERROR: {len(diff)} Unexpected items in data! \n"
+                    f"💔 ERROR: {len(new_columns)} Unexpected items in data! \n"
                     "Are you sure you specified the correct --input-data-type?\n"
                     "If the object type is correct, add extra columns with:"
-                    f"\n--extra-input-columns \"{','.join(diff)}\"\nSkipping entire batch of {len(_df)} tweets!",
+                    f"\n--extra-input-columns \"{','.join(new_columns)}\"\nSkipping rows with unexpected data!",
                     fg="red",
                 ),
                 err=True,
             )
             log.error(
-                f"CSV Unexpected Data: \"{','.join(diff)}\". Expected {len(self.columns)} columns, got {len(_df.columns)}. Skipping entire batch of {len(_df)} tweets!"
+                f"CSV Unexpected Data: \"{','.join(new_columns)}\". Expected {len(self.columns)} columns. Skipping rows with unexpected data!"
             )
-            self.counts["parse_errors"] += len(_df)
-            return pd.DataFrame(columns=self.columns)
 
-        return self._process_dataframe(_df.reindex(columns=self.columns))
+    def _iter_flat(self, objects):
+        """
+        Lazily flatten objects into flat dicts, one row at a time, so peak
+        memory doesn't scale with the number of rows in the batch. Rows with
+        unexpected fields are skipped and counted as parse errors.
+
+        The flatten, inline-referenced-tweets, dedupe and column-flatten
+        steps all run inside this one generator: every stage used to be its
+        own generator, costing a frame switch per tweet per stage.
+        """
+        counts = self.counts
+        dataset_ids = self.dataset_ids
+        trie = self._column_trie
+        inline_referenced = self.inline_referenced_tweets
+        allow_duplicates = self.allow_duplicates
+        is_counts_data = self.input_data_type == "counts"
+
+        for o in objects:
+            if isinstance(o, dict) and "data" not in o and "includes" not in o:
+                # The same check ensure_flattened does for already flattened
+                # tweets, without a call and list allocation per line.
+                # Response objects go through twarc, which indexes each
+                # response's includes once for all the tweets in it.
+                flattened = (o,)
+            else:
+                flattened = ensure_flattened(o)
+
+            for tweet in flattened:
+                # (Optional) insert referenced tweets as new rows, before
+                # the tweet that references them:
+                if inline_referenced and "referenced_tweets" in tweet:
+                    formatted = []
+                    for referenced_tweet in tweet["referenced_tweets"]:
+                        # extract the referenced tweet as a new row
+                        counts["referenced_tweets"] += 1
+                        # inherit __twarc metadata from parent tweet
+                        referenced_tweet["__twarc"] = (
+                            tweet["__twarc"] if "__twarc" in tweet else None
+                        )
+                        # write tweet as new row if referenced tweet exists (has more than the 3 default fields):
+                        if len(referenced_tweet.keys()) > 3:
+                            formatted.append(self._format_tweet(referenced_tweet))
+                        else:
+                            counts["unavailable"] += 1
+                    formatted.append(self._format_tweet(tweet))
+                else:
+                    formatted = (self._format_tweet(tweet),)
+
+                # Count and deduplicate before emitting rows:
+                for tweet in formatted:
+                    tweet_id = tweet.get("id")
+                    if tweet_id is None:
+                        if is_counts_data:
+                            counts["tweets"] += 1
+                        else:
+                            # non tweet objects are usually streaming API errors etc.
+                            counts["non_objects"] += 1
+                            continue
+                    else:
+                        counts["tweets"] += 1
+                        if tweet_id in dataset_ids:
+                            counts["duplicates"] += 1
+                            if not allow_duplicates:
+                                continue
+                        else:
+                            dataset_ids.add(tweet_id)
+
+                    row = {}
+                    unexpected = set()
+                    _flatten_tweet(tweet, trie, row, unexpected)
+                    # Check for mismatched columns
+                    if len(unexpected) > 0:
+                        self._report_unexpected(unexpected)
+                        counts["parse_errors"] += 1
+                        continue
+                    yield row
+
+    def iter_rows(self, objects):
+        """
+        Generate flat dicts ready for the csv writer, lazily. Skips the
+        whole DataFrame construction for csv output.
+        """
+        for row in self._iter_flat(objects):
+            self._encode_row(row)
+            yield row
+
+    def process_rows(self, objects):
+        """
+        Process the objects into a list of flat dicts ready for the csv
+        writer.
+        """
+        return list(self.iter_rows(objects))
+
+    def process(self, objects):
+        """
+        Process the objects into a pandas dataframe.
+        """
+        # Construct the dataframe column by column from the known schema:
+        # from_records would rescan every record to work out the columns,
+        # which are fixed here.
+        rows = list(self._iter_flat(objects))
+        nan = float("nan")
+        data = {
+            column: [row.get(column, nan) for row in rows]
+            for column in self.columns
+        }
+        return self._process_dataframe(pd.DataFrame(data, columns=self.columns))
@@ -1,5 +1,6 @@
 import pandas
 import pathlib
+import pytest
 import twarc_csv
 
 from click.testing import CliRunner
@@ -99,3 +100,28 @@ def test_lists():
 
 def test_geo():
     _process_file("geo_tweets", 2, extra=" --input-data-type tweets")
+
+
+def test_workers():
+    _process_file("kpop", extra=" --workers 2 --batch-size 10")
+
+
+def test_parquet():
+    pytest.importorskip("pyarrow")
+    input_file = test_data / "flat.jsonl"
+    output_file = test_data / "flat.parquet"
+    if output_file.is_file():
+        output_file.unlink()
+
+    result = runner.invoke(
+        twarc_csv.csv, [str(input_file), str(output_file), "--output-format", "parquet"]
+    )
+
+    assert output_file.is_file()
+    df = pandas.read_parquet(output_file)
+    assert len(df) == 100
+    assert type(df["id"]) == pandas.Series
+    # unlike csv, parquet keeps newlines in text verbatim
+    assert df["text"].str.contains("\n").any()
+    assert not df["text"].str.contains(r"\\n", regex=False).any()
+    output_file.unlink()
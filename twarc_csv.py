@@ -28,8 +28,9 @@ def _validate_output_columns(context, parameter, value):
             "compliance": dataframe_converter.DEFAULT_COMPLIANCE_COLUMNS,
             "lists": dataframe_converter.DEFAULT_LISTS_COLUMNS,
         }
+        valid_columns = set(valid[input_data_type])
         for v in values:
-            if v not in valid[input_data_type]:
+            if v not in valid_columns:
                 raise click.BadOptionUsage(
                     parameter.name,
                     f'"{v}" is not a valid entry for --{parameter.name}. Must be a comma separated string, without spaces, valid entries: {",".join(valid[input_data_type])}',
@@ -92,12 +93,24 @@ def _validate_output_columns(context, parameter, value):
     callback=_validate_output_columns,
     help="Specify what columns to output in the CSV. Default is all input columns.",
 )
+@click.option(
+    "--output-format",
+    default="csv",
+    type=click.Choice(["csv", "parquet"], case_sensitive=False),
+    help="Output file format. parquet requires the pyarrow package and a file (not stdout) output. Default: csv.",
+)
 @click.option(
     "--batch-size",
     type=int,
     default=100,
     help="How many lines to process per chunk. Default is 100. Reduce this if output is slow.",
 )
+@click.option(
+    "--workers",
+    type=int,
+    default=1,
+    help="How many worker processes to use for conversion. Default is 1, no extra processes. Row order and duplicate removal are preserved.",
+)
 @click.option(
     "--hide-stats",
     is_flag=True,
@@ -122,7 +135,9 @@ def csv(
     allow_duplicates,
     extra_input_columns,
     output_columns,
+    output_format,
     batch_size,
+    workers,
     hide_stats,
     hide_progress,
 ):
@@ -140,6 +155,26 @@ def csv(
         )
         return
 
+    if output_format == "parquet":
+        if csv_writer.pyarrow is None:
+            click.echo(
+                click.style(
+                    f"💔 parquet output requires the pyarrow package: pip install pyarrow",
+                    fg="red",
+                ),
+                err=True,
+            )
+            return
+        if outfile.name == "<stdout>":
+            click.echo(
+                click.style(
+                    f"💔 parquet output requires an output file, not stdout!",
+                    fg="red",
+                ),
+                err=True,
+            )
+            return
+
     if (
         not (infile.name == "<stdin>" or outfile.name == "<stdout>")
         and os.stat(infile.name).st_size == 0
@@ -169,8 +204,9 @@ def csv(
         infile=infile,
         outfile=outfile,
         converter=converter,
-        output_format="csv",
+        output_format=output_format.lower(),
         batch_size=batch_size,
+        workers=workers,
         hide_progress=hide_progress,
     )
     writer.process()